@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch-Transkription aufgezeichneter Sessions (WAV/FLAC) mit demselben Vosk-Setup
+wie chat.py (vosk_setup.py: Model(MODEL_PATH), KaldiRecognizer bei SAMPLE_RATE).
+Braucht kein Audio-Gerät (kein sounddevice) und keinen Gemini-Zugang.
+
+    python batch_transcribe.py aufnahmen/ -o transkripte.jsonl -j 4
+
+Jede Datei wird blockweise gestreamt, pro Worker-Prozess wird das Modell nur
+einmal geladen. Pro Datei entsteht eine JSONL-Zeile mit Wort-Timings.
+Ein abgebrochener Lauf wird beim erneuten Start fortgesetzt: fertige Dateien
+werden übersprungen, fehlgeschlagene erneut versucht. Vorher wird die Ausgabe
+kompaktiert, sodass pro Datei genau eine Zeile übrig bleibt.
+--no-resume beginnt mit einer leeren Ausgabedatei.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from vosk_setup import BLOCKSIZE, MODEL_PATH, load_vosk_model, make_dict_recognizer
+
+# ---- optional: soundfile (FLAC) ----
+try:
+    import soundfile as sf
+    HAVE_SOUNDFILE = True
+except Exception:
+    HAVE_SOUNDFILE = False
+
+
+AUDIO_EXTS = (".wav", ".flac")
+
+
+# =============================
+# Audio lesen
+# =============================
+def _to_mono_int16(frames: np.ndarray) -> bytes:
+    if frames.ndim > 1 and frames.shape[1] > 1:
+        frames = frames.mean(axis=1).astype(np.int16)
+    return frames.reshape(-1).astype(np.int16, copy=False).tobytes()
+
+def open_audio(path: str):
+    """
+    returns: (sample_rate, blocks) – blocks liefert int16-Mono-PCM in BLOCKSIZE-Frames
+    """
+    if path.lower().endswith(".flac"):
+        if not HAVE_SOUNDFILE:
+            raise RuntimeError("FLAC benötigt 'soundfile' (pip install soundfile).")
+        sr = sf.info(path).samplerate
+
+        def flac_blocks():
+            for block in sf.blocks(path, blocksize=BLOCKSIZE, dtype="int16", always_2d=True):
+                yield _to_mono_int16(block)
+
+        return sr, flac_blocks()
+
+    wf = wave.open(path, "rb")
+    if wf.getsampwidth() != 2:
+        wf.close()
+        raise RuntimeError(f"nur 16-bit PCM unterstützt (sampwidth={wf.getsampwidth()})")
+    sr = wf.getframerate()
+    ch = wf.getnchannels()
+
+    def wav_blocks():
+        with wf:
+            while True:
+                raw = wf.readframes(BLOCKSIZE)
+                if not raw:
+                    break
+                if ch == 1:
+                    yield raw
+                else:
+                    yield _to_mono_int16(np.frombuffer(raw, dtype=np.int16).reshape(-1, ch))
+
+    return sr, wav_blocks()
+
+
+# =============================
+# Worker (eigener Prozess)
+# =============================
+_model = None
+
+def _init_worker(model_path: str):
+    global _model
+    _model = load_vosk_model(model_path)
+
+def _segment(result_json: str) -> dict | None:
+    res = json.loads(result_json)
+    text = (res.get("text") or "").strip()
+    if not text:
+        return None
+    words = [
+        {"word": w.get("word"), "start": w.get("start"), "end": w.get("end"), "conf": w.get("conf")}
+        for w in res.get("result") or []
+    ]
+    return {
+        "text": text,
+        "start": words[0]["start"] if words else None,
+        "end": words[-1]["end"] if words else None,
+        "words": words,
+    }
+
+def transcribe_file(path: str) -> dict:
+    t0 = time.perf_counter()
+    try:
+        sr, blocks = open_audio(path)
+        # Vosk resampled intern, falls die Datei nicht SAMPLE_RATE hat
+        rec = make_dict_recognizer(_model, sr)
+        rec.SetWords(True)
+
+        n_bytes = 0
+        segments = []
+        for data in blocks:
+            n_bytes += len(data)
+            if rec.AcceptWaveform(data):
+                seg = _segment(rec.Result())
+                if seg:
+                    segments.append(seg)
+        seg = _segment(rec.FinalResult())
+        if seg:
+            segments.append(seg)
+    except Exception as e:
+        return {"file": path, "error": f"{type(e).__name__}: {e}"}
+
+    decode_sec = time.perf_counter() - t0
+    duration = n_bytes / 2 / sr
+    return {
+        "file": path,
+        "sample_rate": sr,
+        "duration_sec": round(duration, 3),
+        "decode_sec": round(decode_sec, 3),
+        "rtf": round(decode_sec / duration, 4) if duration > 0 else None,
+        "text": " ".join(s["text"] for s in segments),
+        "segments": segments,
+    }
+
+
+# =============================
+# Dateien / Resume
+# =============================
+def find_audio_files(inputs: list[str]) -> list[str]:
+    found = []
+    for inp in inputs:
+        if os.path.isdir(inp):
+            for root, _dirs, files in os.walk(inp):
+                for name in files:
+                    if name.lower().endswith(AUDIO_EXTS):
+                        found.append(os.path.abspath(os.path.join(root, name)))
+        elif os.path.isfile(inp):
+            found.append(os.path.abspath(inp))
+        else:
+            print(f"[Batch] nicht gefunden: {inp}", file=sys.stderr)
+    return sorted(set(found))
+
+def load_records(out_path: str) -> dict[str, dict]:
+    """
+    returns: Datei -> letzter Datensatz (ein Erfolg wird nie durch einen Fehler ersetzt)
+    """
+    records: dict[str, dict] = {}
+    if not os.path.exists(out_path):
+        return records
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue        # abgeschnittene letzte Zeile nach Abbruch
+            path = rec.get("file")
+            if not path:
+                continue
+            if "error" in rec and path in records and "error" not in records[path]:
+                continue
+            records[path] = rec
+    return records
+
+def compact_output(out_path: str, files: list[str]) -> set[str]:
+    """
+    Schreibt die Ausgabe neu: pro Datei eine Zeile, Fehler-Zeilen von Dateien,
+    die in diesem Lauf erneut versucht werden, fallen weg.
+    returns: bereits erfolgreich transkribierte Dateien
+    """
+    records = load_records(out_path)
+    done = {path for path, rec in records.items() if "error" not in rec}
+    retry = set(files) - done
+    keep = [rec for path, rec in records.items() if path not in retry]
+
+    if os.path.exists(out_path):
+        tmp = out_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in keep:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        os.replace(tmp, out_path)
+    return done
+
+
+# =============================
+# Main
+# =============================
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Vosk-Batch-Transkription von WAV/FLAC-Archiven")
+    ap.add_argument("inputs", nargs="+", help="Dateien oder Verzeichnisse (rekursiv)")
+    ap.add_argument("-o", "--output", default="transcripts.jsonl", help="JSONL-Ausgabe (wird fortgesetzt)")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Anzahl Worker-Prozesse")
+    ap.add_argument("--model", default=MODEL_PATH, help="Vosk-Modellpfad")
+    ap.add_argument("--no-resume", action="store_true", help="Ausgabedatei leeren und alles neu transkribieren")
+    args = ap.parse_args(argv)
+
+    if not os.path.isdir(args.model):
+        print(f"Vosk-Modellpfad nicht gefunden: {args.model}", file=sys.stderr)
+        return 2
+
+    files = find_audio_files(args.inputs)
+    if args.no_resume:
+        open(args.output, "w", encoding="utf-8").close()
+        done = set()
+    else:
+        done = compact_output(args.output, files)
+    todo = [f for f in files if f not in done]
+    print(f"[Batch] {len(files)} Dateien, {len(files) - len(todo)} bereits fertig, {len(todo)} offen.")
+    if not todo:
+        return 0
+
+    audio_sec = 0.0
+    n_ok = n_err = 0
+    broken = False
+    t_start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=max(1, args.jobs),
+        initializer=_init_worker,
+        initargs=(args.model,),
+    ) as pool:
+        futures = {pool.submit(transcribe_file, f): f for f in todo}
+        try:
+            for i, fut in enumerate(as_completed(futures), 1):
+                try:
+                    rec = fut.result()
+                except BrokenProcessPool:
+                    # Worker abgestürzt (Kaldi-Abort, OOM-Kill): alle offenen Futures
+                    # sind verloren. Fehler-Zeile schreiben und sauber aufhören –
+                    # der nächste Lauf versucht die Datei und den Rest erneut.
+                    rec = {"file": futures[fut], "error": "BrokenProcessPool: Worker-Prozess abgestürzt"}
+                    broken = True
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+
+                if "error" in rec:
+                    n_err += 1
+                    print(f"[{i}/{len(todo)}] FEHLER {rec['file']}: {rec['error']}", file=sys.stderr)
+                    if broken:
+                        print("[Batch] Worker-Pool defekt – Abbruch, erneuter Start setzt fort.", file=sys.stderr)
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        break
+                    continue
+
+                n_ok += 1
+                audio_sec += rec["duration_sec"]
+                print(f"[{i}/{len(todo)}] {os.path.basename(rec['file'])}: "
+                      f"{rec['duration_sec']:.1f}s Audio, RTF {rec['rtf']}")
+        except KeyboardInterrupt:
+            print("\n[Batch] Abgebrochen – erneuter Start setzt fort.", file=sys.stderr)
+            pool.shutdown(wait=False, cancel_futures=True)
+            return 130
+
+    wall = time.perf_counter() - t_start
+    print(
+        f"[Batch] {n_ok} ok, {n_err} Fehler, {audio_sec:.1f}s Audio in {wall:.1f}s "
+        f"-> {audio_sec / wall if wall > 0 else 0.0:.2f} Audio-Sekunden/Sekunde"
+    )
+    return 1 if n_err else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import asyncio
-import io
 import json
 import os
 import queue
@@ -12,15 +11,20 @@ import sys
 import threading
 import time
 import wave
-import tempfile
 import subprocess
 import shutil
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
 
 import numpy as np
 import sounddevice as sd
 from vosk import Model, KaldiRecognizer
 
+from vosk_setup import MODEL_PATH, SAMPLE_RATE, BLOCKSIZE, load_vosk_model, make_dict_recognizer
+
 from google import genai
 from google.genai import types
 
@@ -42,10 +46,8 @@ except Exception:
 # =============================
 # Konfiguration
 # =============================
-MODEL_PATH   = "vosk-model-small-de-0.15"
-SAMPLE_RATE  = 16000
+# MODEL_PATH, SAMPLE_RATE, BLOCKSIZE: siehe vosk_setup.py
 CHANNELS     = 1
-BLOCKSIZE    = 4000
 
 WAKE_PHRASE  = "hallo michaela"
 SLEEP_PHRASE = "danke michaela"
@@ -111,6 +113,16 @@ TTS_EDGE_RATE  = "+0%"                # z.B. "+10%" oder "-10%"
 TTS_EDGE_VOL   = "+0%"                # z.B. "+10%" oder "-10%"
 TTS_EDGE_PITCH = "+0Hz"               # z.B. "+2Hz" oder "-2Hz"
 
+# Füller-Audio, falls Gemini länger braucht (vorab mit edge-tts synthetisiert)
+FILLER_ENABLED   = True
+FILLER_DELAY_SEC = 0.8                # so lange warten, bevor ein Füller startet
+FILLER_PHRASES = [
+    "Einen Moment, Meister Tobias…",
+    "Sekunde, ich denke nach.",
+    "Gleich habe ich es.",
+    "Ich prüfe das kurz.",
+]
+
 # pyttsx3 (Offline)
 TTS_RATE_WPM = 175
 TTS_VOICE_HINT = "de"                 # versucht deutsche Stimme zu finden
@@ -126,6 +138,34 @@ RETRY_MAX = 5
 RETRY_BASE_SLEEP = 0.6
 RETRY_MAX_SLEEP  = 8.0
 
+# Adaptive Modellwahl fürs Diktat: Rangliste groß -> klein.
+# Wake/Sleep/Kommandos laufen immer auf MODEL_PATH (klein, Grammatik).
+ASR_MODEL_CANDIDATES = [
+    "vosk-model-de-0.21",
+    MODEL_PATH,
+]
+ASR_RTF_BUDGET       = 0.5            # max. Real-Time-Factor des Diktat-Modells
+ASR_RTF_HEADROOM     = 0.8            # Upgrade nur, wenn Prognose < Budget * Headroom
+ASR_RTF_EWMA_ALPHA   = 0.1
+ASR_UPGRADE_HOLD_SEC = 30.0           # Mindestabstand vor einem Wechsel nach oben
+ASR_UPGRADE_HOLD_MAX = 600.0          # verdoppelt sich, wenn ein Upgrade schnell scheitert
+ASR_RECALIBRATE_SEC  = 120.0          # Kalibrierwerte für ein Upgrade höchstens so alt
+ASR_BACKLOG_MAX      = AUDIO_QUEUE_MAX // 4   # Blöcke in audio_q -> sofort kleiner
+ASR_CALIBRATION_SEC  = 3.0
+# Kalibrierung braucht echte Sprache (16 kHz, mono, 16 bit, ein paar Sekunden).
+# Fehlt die Datei, wird mit den ersten ASR_CALIBRATION_SEC Diktat kalibriert
+# und diese Aufnahme hier für künftige Starts gespeichert.
+ASR_CALIBRATION_WAV  = "asr_calibration.wav"
+
+# Metriken (Prometheus-Textformat unter http://METRICS_HOST:METRICS_PORT/metrics)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Lokale Kommandos (werden ohne Gemini direkt beantwortet)
+LOCAL_COMMANDS_ENABLED = True
+TTS_VOLUME_STEP = 20                  # Prozentpunkte pro "lauter"/"leiser"
+
 
 # =============================
 # Hilfsfunktionen
@@ -160,12 +200,15 @@ def pick_input_device_by_hint(hint: str | None):
                 return i
     return None
 
-def flush_queue(q: queue.Queue, max_items: int = 200):
+def flush_queue(q: queue.Queue, max_items: int = 200) -> int:
+    n = 0
     for _ in range(max_items):
         try:
             q.get_nowait()
         except queue.Empty:
             break
+        n += 1
+    return n
 
 def _status_code(exc: Exception) -> int | None:
     return getattr(exc, "status_code", None)
@@ -207,6 +250,196 @@ def clean_for_tts(text: str) -> str:
     return text
 
 
+# =============================
+# Metriken
+# =============================
+# Updates laufen ohne Lock (GIL), damit sie auch im Audio-Callback billig sind.
+# Bei mehreren gleichzeitigen Schreibern kann unter Last ein Inkrement verloren
+# gehen – für Monitoring ausreichend.
+def _fmt_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, labels: dict[str, str]):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, labels: dict[str, str], fn: Callable[[], float] | None = None):
+        self.name = name
+        self.labels = labels
+        self.value = 0.0
+        self.fn = fn          # optional: Wert wird erst beim Scrape gelesen
+
+    def set(self, v: float):
+        self.value = v
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def samples(self):
+        v = self.value
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception:
+                pass
+        yield self.name, self.labels, v
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, labels: dict[str, str], buckets: tuple[float, ...]):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)   # letzter Eintrag: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect.bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def samples(self):
+        acc = 0
+        for le, c in zip(self.buckets + (float("inf"),), list(self.counts)):
+            acc += c
+            yield self.name + "_bucket", {**self.labels, "le": _fmt_value(float(le))}, acc
+        yield self.name + "_sum", self.labels, self.sum
+        yield self.name + "_count", self.labels, acc
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+RTF_BUCKETS     = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0)
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = "michaela_"):
+        self.prefix = prefix
+        self._lock = threading.Lock()        # nur fürs Registrieren, nicht für Updates
+        self._metrics: dict[tuple, object] = {}
+        self._help: dict[str, tuple[str, str]] = {}
+
+    def _get(self, cls, name: str, help: str, labels: dict[str, str], **kw):
+        full = self.prefix + name
+        key = (full, tuple(sorted(labels.items())))
+        with self._lock:
+            m = self._metrics.get(key)
+            if m is None:
+                m = cls(full, labels, **kw)
+                self._metrics[key] = m
+                self._help.setdefault(full, (cls.kind, help))
+        return m
+
+    def counter(self, name: str, help: str, **labels: str) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float] | None = None, **labels: str) -> Gauge:
+        return self._get(Gauge, name, help, labels, fn=fn)
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            helps = dict(self._help)
+        lines = []
+        for name in sorted(helps):
+            kind, help = helps[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for m in metrics:
+                if m.name != name:
+                    continue
+                for sname, labels, v in m.samples():
+                    lines.append(f"{sname}{_fmt_labels(labels)} {_fmt_value(v)}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+M_QUEUE_DROPS = {
+    name: metrics.counter("queue_drops_total", "Verworfene Queue-Einträge", queue=name)
+    for name in ("audio", "text", "tts")
+}
+M_AUDIO_STATUS   = metrics.counter("audio_status_total", "Status-Meldungen (Over-/Underflow) im Audio-Callback")
+M_LLM_LATENCY    = {
+    outcome: metrics.histogram("llm_latency_seconds", "Dauer einer Gemini-Anfrage inkl. Retries", outcome=outcome)
+    for outcome in ("ok", "quota", "error", "cancelled", "dropped")
+}
+M_LLM_RETRIES    = metrics.counter("llm_retries_total", "Wiederholte Gemini-Anfragen")
+M_LLM_ERRORS     = {
+    kind: metrics.counter("llm_errors_total", "Fehlgeschlagene Gemini-Anfragen", kind=kind)
+    for kind in ("quota", "fatal")
+}
+M_TTS_SYNTH      = metrics.histogram("tts_synthesis_seconds", "Dauer der TTS-Synthese bis zum ersten Audio")
+M_TTS_PLAYBACK   = metrics.histogram("tts_playback_seconds", "Dauer der TTS-Wiedergabe")
+M_SESSION_ACTIVE = metrics.gauge("session_active", "1 wenn eine Session aktiv ist")
+M_SESSION_TRANS  = {
+    to: metrics.counter("session_transitions_total", "Session-Wechsel", to=to)
+    for to in ("active", "inactive")
+}
+M_LOCAL_CMDS     = metrics.counter("local_commands_total", "Lokal beantwortete Kommandos")
+M_TTS_FILLERS    = metrics.counter("tts_fillers_total", "Abgespielte Füller während Gemini rechnet")
+
+def asr_rtf_histogram(recognizer: str) -> Histogram:
+    return metrics.histogram(
+        "asr_rtf", "Real-Time-Factor des Recognizers (Decodierzeit / Audiodauer)",
+        buckets=RTF_BUCKETS, recognizer=recognizer,
+    )
+
+def accept_timed(rec, data: bytes, hist: Histogram) -> bool:
+    t0 = time.perf_counter()
+    done = rec.AcceptWaveform(data)
+    audio_sec = len(data) / (2 * CHANNELS * SAMPLE_RATE)
+    if audio_sec > 0:
+        hist.observe((time.perf_counter() - t0) / audio_sec)
+    return done
+
+
 # =============================
 # State für Threads
 # =============================
@@ -221,6 +454,21 @@ session_state = SessionState()
 # Flag: gerade am Sprechen? (damit TTS nicht wieder als Dictat erkannt wird)
 tts_busy_evt = threading.Event()
 
+# Sofort-Abbruch der Sprachausgabe aus einem anderen Thread (z.B. "stopp")
+tts_interrupt_evt = threading.Event()
+_tts_engine = None                    # pyttsx3-Engine des TTS-Workers
+_tts_proc: "subprocess.Popen | None" = None   # laufender ffplay/mpg123-Prozess
+
+# Gemini-Anfrage läuft (für Füller-Audio im TTS-Worker)
+llm_pending_evt = threading.Event()
+llm_pending_since = 0.0
+llm_request_seq = 0
+llm_request_session = 0               # session_id, in der die laufende Anfrage gestellt wurde
+llm_cancelled_seq = 0                 # per "stopp" abgebrochene Anfrage -> Antwort verwerfen
+
+# Lautstärke-Offset in Prozentpunkten (per "lauter"/"leiser" änderbar)
+tts_volume_offset = 0
+
 
 # =============================
 # Queues
@@ -229,13 +477,34 @@ audio_q: "queue.Queue[bytes]" = queue.Queue(maxsize=AUDIO_QUEUE_MAX)
 text_q:  "queue.Queue[str]"   = queue.Queue(maxsize=TEXT_QUEUE_MAX)
 tts_q:   "queue.Queue[str]"   = queue.Queue(maxsize=TTS_QUEUE_MAX)
 
+for _name, _q in (("audio", audio_q), ("text", text_q), ("tts", tts_q)):
+    metrics.gauge("queue_depth", "Aktuelle Queue-Länge", fn=_q.qsize, queue=_name)
+
+def set_session_active(active: bool):
+    """
+    Session-Wechsel: State umschalten und __WAKE__/__SLEEP__ an den Gemini-Worker.
+    """
+    with state_lock:
+        session_state.active = active
+        session_state.session_id += 1
+    M_SESSION_ACTIVE.set(1 if active else 0)
+    M_SESSION_TRANS["active" if active else "inactive"].inc()
+
+    marker = "__WAKE__" if active else "__SLEEP__"
+    try:
+        text_q.put_nowait(marker)
+    except queue.Full:
+        M_QUEUE_DROPS["text"].inc(flush_queue(text_q))
+        text_q.put_nowait(marker)
+
 def audio_callback(indata, frames, t, status):
     if status:
+        M_AUDIO_STATUS.inc()
         print(status, file=sys.stderr)
     try:
         audio_q.put_nowait(bytes(indata))
     except queue.Full:
-        pass
+        M_QUEUE_DROPS["audio"].inc()
 
 
 # =============================
@@ -282,90 +551,135 @@ def _select_voice_pyttsx3(engine, hint: str):
 
 
 
-def _is_riff_wav(b: bytes) -> bool:
-    return len(b) > 12 and b[:4] == b"RIFF" and b[8:12] == b"WAVE"
+def _edge_volume_pct() -> int:
+    base = int(TTS_EDGE_VOL.strip().rstrip("%") or 0)
+    return max(-100, min(100, base + tts_volume_offset))
 
-async def _edge_tts_get_audio_bytes(text: str) -> tuple[bytes, str]:
-    """
-    returns: (audio_bytes, fmt) where fmt is "wav" or "mp3"
-    """
-    kwargs = dict(
+def _edge_volume() -> str:
+    return f"{_edge_volume_pct():+d}%"
+
+EDGE_TTS_SAMPLE_RATE = 24000          # edge-tts liefert 24 kHz Mono-MP3
+
+def _edge_communicate(text: str):
+    # edge-tts kennt kein output_format: die Ausgabe ist immer MP3
+    return edge_tts.Communicate(
+        text,
         voice=TTS_EDGE_VOICE,
         rate=TTS_EDGE_RATE,
-        volume=TTS_EDGE_VOL,
+        volume=_edge_volume(),
         pitch=TTS_EDGE_PITCH,
     )
 
-    # Versuch: WAV (riff pcm)
-    try:
-        comm = edge_tts.Communicate(
-            text,
-            **kwargs,
-            output_format="riff-24khz-16bit-mono-pcm",
-        )
-        fmt = "wav"
-    except TypeError:
-        # alte edge-tts Version -> kein output_format => liefert typischerweise MP3
-        comm = edge_tts.Communicate(text, **kwargs)
-        fmt = "mp3"
-
+async def _edge_tts_get_audio_bytes(text: str) -> bytes:
+    """
+    returns: komplette MP3-Ausgabe
+    """
     buf = bytearray()
-    async for chunk in comm.stream():
+    async for chunk in _edge_communicate(text).stream():
         if chunk.get("type") == "audio":
             buf.extend(chunk.get("data", b""))
+    return bytes(buf)
 
-    audio = bytes(buf)
-    # Safety: falls edge-tts entgegen fmt etwas anderes liefert
-    if fmt == "wav" and not _is_riff_wav(audio):
-        fmt = "mp3"
-    return audio, fmt
-
-def _play_wav_bytes_blocking(wav_bytes: bytes):
-    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
-        sr = wf.getframerate()
-        ch = wf.getnchannels()
-        frames = wf.readframes(wf.getnframes())
-
-    audio = np.frombuffer(frames, dtype=np.int16)
-    if ch > 1:
-        audio = audio.reshape(-1, ch)
-
-    sd.play(audio, samplerate=sr, blocking=True)
-
-def _play_mp3_bytes_blocking(mp3_bytes: bytes):
+def _mp3_player_cmd() -> list[str]:
     """
     MP3 decodieren wir nicht in Python, sondern über ffplay oder mpg123 (wenn installiert).
+    Beide lesen von stdin, damit die Wiedergabe schon während der Synthese beginnt.
     """
     ffplay = shutil.which("ffplay")
+    if ffplay:
+        # -nodisp: kein Fenster, -autoexit: beendet nach Playback, -loglevel quiet: leise
+        return [ffplay, "-nodisp", "-autoexit", "-loglevel", "quiet", "-"]
     mpg123 = shutil.which("mpg123")
+    if mpg123:
+        return [mpg123, "-q", "-"]
+    raise RuntimeError(
+        "edge-tts liefert MP3, aber weder ffplay (ffmpeg) noch mpg123 sind installiert. "
+        "Installiere z.B. 'sudo apt install ffmpeg' oder setze TTS_MODE='pyttsx3'."
+    )
 
-    if not ffplay and not mpg123:
-        raise RuntimeError(
-            "edge-tts liefert MP3, aber weder ffplay (ffmpeg) noch mpg123 sind installiert. "
-            "Installiere z.B. 'sudo apt install ffmpeg' oder setze TTS_MODE='pyttsx3'."
-        )
+def _decode_mp3(mp3_bytes: bytes) -> np.ndarray:
+    """
+    MP3 -> int16-Mono-PCM bei EDGE_TTS_SAMPLE_RATE (über ffmpeg).
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg nicht installiert")
+    proc = subprocess.run(
+        [ffmpeg, "-loglevel", "quiet", "-f", "mp3", "-i", "-",
+         "-f", "s16le", "-ac", "1", "-ar", str(EDGE_TTS_SAMPLE_RATE), "-"],
+        input=mp3_bytes, capture_output=True, check=True,
+    )
+    return np.frombuffer(proc.stdout, dtype=np.int16)
 
-    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=True) as f:
-        f.write(mp3_bytes)
-        f.flush()
+async def _edge_tts_stream_play(text: str, on_audio_ready: Callable[[], None]) -> bool:
+    """
+    Spielt die Ausgabe schon während der Synthese ab: on_audio_ready kommt mit
+    dem ersten Audio-Chunk, danach geht jeder Chunk direkt an den Player.
+    returns: True, wenn etwas abgespielt wurde
+    """
+    global _tts_proc
 
-        if ffplay:
-            # -nodisp: kein Fenster, -autoexit: beendet nach Playback, -loglevel quiet: leise
-            subprocess.run([ffplay, "-nodisp", "-autoexit", "-loglevel", "quiet", f.name], check=False)
-        else:
-            subprocess.run([mpg123, "-q", f.name], check=False)
+    cmd = _mp3_player_cmd()
+    proc = None
 
-def tts_speak_edge(text: str):
+    try:
+        async for chunk in _edge_communicate(text).stream():
+            if chunk.get("type") != "audio":
+                continue
+            data = chunk.get("data", b"")
+            if not data:
+                continue
+
+            if proc is None:
+                on_audio_ready()
+                if tts_interrupt_evt.is_set():
+                    return False
+                # Popen, damit interrupt_tts() den Prozess beenden kann
+                proc = _tts_proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+            if tts_interrupt_evt.is_set():
+                break
+            try:
+                # write() blockiert, solange die Pipe voll ist
+                proc.stdin.write(data)
+            except (BrokenPipeError, OSError):
+                break           # Player beendet (z.B. interrupt_tts)
+    finally:
+        if proc is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                if tts_interrupt_evt.is_set():
+                    proc.terminate()
+                proc.wait()     # wartet, bis der Player ausgespielt hat
+            finally:
+                _tts_proc = None
+
+    return proc is not None
+
+def tts_speak_edge(text: str, on_audio_ready: Callable[[], None] | None = None):
+    """
+    on_audio_ready: wird mit dem ersten Audio-Chunk aufgerufen, direkt vor der
+    Wiedergabe (z.B. um einen laufenden Füller abzubrechen).
+    """
     text = clean_for_tts(text)
     if not text:
         return
 
-    audio_bytes, fmt = asyncio.run(_edge_tts_get_audio_bytes(text))
+    t0 = time.monotonic()
+    first_audio: list[float] = []
 
-    if fmt == "wav":
-        _play_wav_bytes_blocking(audio_bytes)
-    else:
-        _play_mp3_bytes_blocking(audio_bytes)
+    def ready():
+        first_audio.append(time.monotonic())
+        if on_audio_ready is not None:
+            on_audio_ready()
+
+    asyncio.run(_edge_tts_stream_play(text, ready))
+    if first_audio:
+        M_TTS_SYNTH.observe(first_audio[0] - t0)
+        M_TTS_PLAYBACK.observe(time.monotonic() - first_audio[0])
 
 def tts_speak_pyttsx3(engine, text: str):
     text = clean_for_tts(text)
@@ -374,16 +688,88 @@ def tts_speak_pyttsx3(engine, text: str):
 
     # Satzweise sprechen -> wirkt oft natürlicher
     sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+    # pyttsx3 synthetisiert und spielt in einem Schritt -> nur Wiedergabe messbar
+    t0 = time.monotonic()
     for s in sentences[:14]:
+        if tts_interrupt_evt.is_set():
+            break
         engine.say(s)
         engine.runAndWait()
         time.sleep(0.12)
+    M_TTS_PLAYBACK.observe(time.monotonic() - t0)
+
+
+def interrupt_tts():
+    """
+    Bricht die laufende Sprachausgabe sofort ab – auch während tts_worker in einer
+    blockierenden Wiedergabe steckt – und verwirft alles, was noch wartet.
+    Eine noch laufende Gemini-Anfrage wird als abgebrochen markiert, damit ihre
+    Antwort nicht nachträglich gesprochen wird.
+    """
+    global llm_cancelled_seq
+    llm_cancelled_seq = llm_request_seq
+    M_QUEUE_DROPS["tts"].inc(flush_queue(tts_q, max_items=TTS_QUEUE_MAX))
+    tts_interrupt_evt.set()
+    try:
+        sd.stop()
+    except Exception:
+        pass
+    proc = _tts_proc
+    if proc is not None:
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+    engine = _tts_engine
+    if engine is not None:
+        try:
+            engine.stop()
+        except Exception:
+            pass
+    tts_busy_evt.clear()
+
+
+def presynth_fillers(out: list[tuple[np.ndarray, int, int]]):
+    """
+    Synthetisiert FILLER_PHRASES einmalig als PCM (aktuelle edge-tts Stimme).
+    Läuft im Hintergrund; fertige Füller landen nach und nach in out,
+    jeweils mit der edge-tts Lautstärke (%) zum Zeitpunkt der Synthese.
+    """
+    if not shutil.which("ffmpeg"):
+        print("[TTS] ffmpeg fehlt (MP3 -> PCM) – Füller deaktiviert.", file=sys.stderr)
+        return
+    for phrase in FILLER_PHRASES:
+        text = clean_for_tts(phrase)
+        if not text:
+            continue
+        vol_pct = _edge_volume_pct()
+        try:
+            audio = _decode_mp3(asyncio.run(_edge_tts_get_audio_bytes(text)))
+        except Exception as e:
+            print(f"[TTS] Füller '{phrase}' fehlgeschlagen: {e}", file=sys.stderr)
+            continue
+        if len(audio):
+            out.append((audio, EDGE_TTS_SAMPLE_RATE, vol_pct))
+
+def _scale_filler(audio: np.ndarray, synth_vol_pct: int) -> np.ndarray:
+    """
+    Passt einen vorab synthetisierten Füller an die aktuelle Lautstärke an
+    ("lauter"/"leiser" wirken sonst nur auf neue Antworten).
+    """
+    now_pct = _edge_volume_pct()
+    if now_pct == synth_vol_pct or synth_vol_pct <= -100:
+        return audio
+    gain = (100 + now_pct) / (100 + synth_vol_pct)
+    return np.clip(audio.astype(np.float32) * gain, -32768, 32767).astype(np.int16)
 
 
 # =============================
 # TTS Worker
 # =============================
-def tts_worker(stop_evt: threading.Event):
+def tts_worker(stop_evt: threading.Event, speak: Callable[[str], None] | None = None):
+    """
+    speak: optionaler Ersatz für die Sprachausgabe (z.B. Stand-in im Soak-Test)
+    """
     if not TTS_ENABLED:
         return
 
@@ -395,6 +781,11 @@ def tts_worker(stop_evt: threading.Event):
     if not use_edge and TTS_MODE.lower() == "edge" and HAVE_PYTTSX3:
         use_pyttsx3 = True
 
+    if speak is not None:
+        use_edge = use_pyttsx3 = False
+
+    global _tts_engine
+
     engine = None
     if use_pyttsx3:
         try:
@@ -408,14 +799,61 @@ def tts_worker(stop_evt: threading.Event):
         except Exception as e:
             print(f"[TTS] pyttsx3 init fehlgeschlagen: {e}", file=sys.stderr)
             engine = None
+    _tts_engine = engine
 
-    if TTS_MODE.lower() == "edge" and not HAVE_EDGE_TTS:
+    if speak is None and TTS_MODE.lower() == "edge" and not HAVE_EDGE_TTS:
         print("[TTS] edge-tts nicht verfügbar. Fallback auf pyttsx3 (falls installiert).", file=sys.stderr)
 
+    fillers: list[tuple[np.ndarray, int, int]] = []
+    if use_edge and FILLER_ENABLED and FILLER_PHRASES:
+        threading.Thread(target=presynth_fillers, args=(fillers,), daemon=True).start()
+    filler_seq = 0        # letzte Anfrage, für die schon ein Füller lief
+    filler_until = 0.0    # Ende des laufenden Füllers (monotonic), 0 = keiner
+
+    def filler_session_ok() -> bool:
+        # nach "danke michaela" keinen Füller mehr für eine noch laufende Anfrage
+        with state_lock:
+            return session_state.active and session_state.session_id == llm_request_session
+
+    def stop_filler():
+        nonlocal filler_until
+        if filler_until:
+            try:
+                sd.stop()
+            except Exception:
+                pass
+            filler_until = 0.0
+
     while not stop_evt.is_set():
         try:
             item = tts_q.get(timeout=0.1)
         except queue.Empty:
+            now = time.monotonic()
+            if filler_until and now >= filler_until:
+                filler_until = 0.0
+                tts_busy_evt.clear()
+
+            # Gemini rechnet schon eine Weile -> Füller nicht blockierend abspielen
+            if (
+                fillers
+                and not filler_until
+                and llm_pending_evt.is_set()
+                and llm_request_seq != filler_seq
+                and llm_request_seq != llm_cancelled_seq
+                and now - llm_pending_since >= FILLER_DELAY_SEC
+                and filler_session_ok()
+            ):
+                filler_seq = llm_request_seq
+                audio, sr, vol_pct = random.choice(fillers)
+                tts_busy_evt.set()
+                try:
+                    audio = _scale_filler(audio, vol_pct)
+                    sd.play(audio, samplerate=sr)
+                    filler_until = now + len(audio) / sr
+                    M_TTS_FILLERS.inc()
+                except Exception as e:
+                    tts_busy_evt.clear()
+                    print(f"[TTS] Füller Fehler: {e}", file=sys.stderr)
             continue
 
         if item == "__EXIT__":
@@ -432,6 +870,7 @@ def tts_worker(stop_evt: threading.Event):
                     engine.stop()
                 except Exception:
                     pass
+            filler_until = 0.0
             tts_busy_evt.clear()
             continue
 
@@ -439,15 +878,25 @@ def tts_worker(stop_evt: threading.Event):
         if not text:
             continue
 
+        tts_interrupt_evt.clear()
         tts_busy_evt.set()
         try:
-            if use_edge and HAVE_EDGE_TTS:
+            if speak is not None:
+                stop_filler()
+                try:
+                    speak(text)
+                except Exception as e:
+                    print(f"[TTS] Fehler: {e}", file=sys.stderr)
+            elif use_edge and HAVE_EDGE_TTS:
                 try:
-                    tts_speak_edge(text)
+                    # Füller läuft weiter bis zum ersten Audio-Chunk der Antwort
+                    tts_speak_edge(text, on_audio_ready=stop_filler)
                 except Exception as e:
                     print(f"[TTS] edge-tts Fehler: {e}", file=sys.stderr)
             elif engine is not None:
+                stop_filler()
                 try:
+                    engine.setProperty("volume", max(0.0, min(1.0, 1.0 + tts_volume_offset / 100)))
                     tts_speak_pyttsx3(engine, text)
                 except Exception as e:
                     print(f"[TTS] pyttsx3 Fehler: {e}", file=sys.stderr)
@@ -455,6 +904,7 @@ def tts_worker(stop_evt: threading.Event):
                 # kein TTS verfügbar
                 pass
         finally:
+            stop_filler()
             tts_busy_evt.clear()
 
 
@@ -477,14 +927,21 @@ def extract_gemini_text(resp) -> str:
         pass
     return getattr(resp, "text", "") or ""
 
-def gemini_worker(stop_evt: threading.Event):
-    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
-    if not api_key:
-        print("[Fehler] GEMINI_API_KEY ist nicht gesetzt. export GEMINI_API_KEY=... (oder GOOGLE_API_KEY).", file=sys.stderr)
-        stop_evt.set()
-        return
+def gemini_worker(stop_evt: threading.Event, make_client: Callable[[], object] | None = None):
+    """
+    make_client: optionaler Ersatz für genai.Client (z.B. Stand-in im Soak-Test)
+    """
+    global llm_pending_since, llm_request_seq, llm_request_session
 
-    client = genai.Client(api_key=api_key)
+    if make_client is None:
+        api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or ""
+        if not api_key:
+            print("[Fehler] GEMINI_API_KEY ist nicht gesetzt. export GEMINI_API_KEY=... (oder GOOGLE_API_KEY).", file=sys.stderr)
+            stop_evt.set()
+            return
+        make_client = lambda: genai.Client(api_key=api_key)
+
+    client = make_client()
     chat = None
     local_session_id = 0
 
@@ -522,7 +979,7 @@ def gemini_worker(stop_evt: threading.Event):
             try:
                 tts_q.put_nowait("__STOP__")
             except queue.Full:
-                flush_queue(tts_q, max_items=TTS_QUEUE_MAX)
+                M_QUEUE_DROPS["tts"].inc(flush_queue(tts_q, max_items=TTS_QUEUE_MAX))
                 tts_q.put_nowait("__STOP__")
             continue
 
@@ -532,7 +989,7 @@ def gemini_worker(stop_evt: threading.Event):
             try:
                 tts_q.put_nowait("__STOP__")
             except queue.Full:
-                flush_queue(tts_q, max_items=TTS_QUEUE_MAX)
+                M_QUEUE_DROPS["tts"].inc(flush_queue(tts_q, max_items=TTS_QUEUE_MAX))
                 tts_q.put_nowait("__STOP__")
             continue
 
@@ -550,10 +1007,20 @@ def gemini_worker(stop_evt: threading.Event):
             chat = make_chat()
 
         attempt = 0
+        outcome = "dropped"     # Session-Wechsel oder Shutdown, falls nichts anderes greift
+        t_start = time.monotonic()
+        llm_request_seq += 1
+        seq = llm_request_seq
+        llm_request_session = local_session_id
+        llm_pending_since = t_start
+        llm_pending_evt.set()
         while attempt <= RETRY_MAX and not stop_evt.is_set():
             with state_lock:
                 if session_state.session_id != local_session_id or not session_state.active:
                     break
+            if llm_cancelled_seq == seq:
+                outcome = "cancelled"
+                break
 
             try:
                 resp = chat.send_message(user_text)
@@ -566,9 +1033,16 @@ def gemini_worker(stop_evt: threading.Event):
                     if len(answer2) >= len(answer):
                         answer = answer2
 
+                llm_pending_evt.clear()
+
                 with state_lock:
                     if session_state.session_id != local_session_id or not session_state.active:
                         break
+                if llm_cancelled_seq == seq:
+                    outcome = "cancelled"
+                    print("\n[Gemini]: Antwort verworfen (stopp).\n")
+                    break
+                outcome = "ok"
 
                 print("\n[Gemini]:\n" + (answer if answer else "(keine Textausgabe)") + "\n")
 
@@ -576,51 +1050,443 @@ def gemini_worker(stop_evt: threading.Event):
                     try:
                         tts_q.put_nowait(answer)
                     except queue.Full:
-                        flush_queue(tts_q, max_items=TTS_QUEUE_MAX)
+                        M_QUEUE_DROPS["tts"].inc(flush_queue(tts_q, max_items=TTS_QUEUE_MAX))
                         try:
                             tts_q.put_nowait(answer)
                         except queue.Full:
-                            pass
+                            M_QUEUE_DROPS["tts"].inc()
 
                 break
 
             except Exception as e:
                 status = _status_code(e)
                 if status == 429 and _looks_like_quota_exhausted(e):
+                    M_LLM_ERRORS["quota"].inc()
+                    outcome = "quota"
                     print("\n[Gemini-Fehler]: Quota/Free-Tier-Limit erreicht (RESOURCE_EXHAUSTED).\n", file=sys.stderr)
                     flush_queue(text_q)
                     break
 
                 if should_retry(e) and attempt < RETRY_MAX:
                     attempt += 1
+                    M_LLM_RETRIES.inc()
                     backoff_sleep(attempt - 1)
                     continue
 
+                M_LLM_ERRORS["fatal"].inc()
+                outcome = "error"
                 print(f"\n[Gemini-Fehler]: {e}\n", file=sys.stderr)
                 break
 
+        M_LLM_LATENCY[outcome].observe(time.monotonic() - t_start)
+        llm_pending_evt.clear()
+
     try:
         client.close()
     except Exception:
         pass
 
 
+# =============================
+# Lokale Kommandos (Fast Path ohne LLM)
+# =============================
+@dataclass
+class LocalCommand:
+    name: str
+    phrases: list[str]
+    handler: Callable[[str], str | None]   # liefert Antworttext (oder None)
+    barge_in: bool = False                 # auch hörbar, während TTS spricht
+
+LOCAL_COMMANDS: list[LocalCommand] = []
+
+def local_command(name: str, *phrases: str, barge_in: bool = False):
+    """
+    Registriert einen Handler für eine oder mehrere Phrasen.
+    Phrasen werden wie Vosk-Ergebnisse normalisiert (norm_text).
+    barge_in=True nur für Kommandos, die selbst nichts sagen (sonst hört
+    die Kommando-Grammatik die eigene Antwort aus dem Lautsprecher).
+    """
+    def deco(fn: Callable[[str], str | None]):
+        LOCAL_COMMANDS.append(LocalCommand(name, [norm_text(p) for p in phrases], fn, barge_in))
+        return fn
+    return deco
+
+# Trie-Knoten: dict Token -> Knoten; Treffer liegt unter dem Schlüssel None
+def build_command_trie(commands: list[LocalCommand]) -> dict:
+    root: dict = {}
+    for cmd in commands:
+        for phrase in cmd.phrases:
+            node = root
+            for tok in phrase.split():
+                node = node.setdefault(tok, {})
+            node[None] = cmd
+    return root
+
+def match_local_command(trie: dict, text: str) -> LocalCommand | None:
+    # nur vollständige Treffer -> "wie spät ist es in tokio" geht an Gemini
+    node = trie
+    for tok in norm_text(text).split():
+        node = node.get(tok)
+        if node is None:
+            return None
+    return node.get(None)
+
+def command_grammar(commands: list[LocalCommand]) -> str:
+    phrases = sorted({p for cmd in commands for p in cmd.phrases})
+    return json.dumps(phrases + ["[unk]"], ensure_ascii=False)
+
+def speak_local(answer: str):
+    print("\n[Michaela]: " + answer + "\n")
+    if not TTS_ENABLED:
+        return
+    try:
+        tts_q.put_nowait(answer)
+    except queue.Full:
+        M_QUEUE_DROPS["tts"].inc(flush_queue(tts_q, max_items=TTS_QUEUE_MAX))
+        try:
+            tts_q.put_nowait(answer)
+        except queue.Full:
+            M_QUEUE_DROPS["tts"].inc()
+
+def run_local_command(cmd: LocalCommand, text: str):
+    M_LOCAL_CMDS.inc()
+    try:
+        answer = cmd.handler(text)
+    except Exception as e:
+        print(f"[Kommando] {cmd.name} fehlgeschlagen: {e}", file=sys.stderr)
+        return
+    if answer:
+        speak_local(answer)
+
+
+WOCHENTAGE = ["Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag", "Sonntag"]
+MONATE = [
+    "Januar", "Februar", "März", "April", "Mai", "Juni",
+    "Juli", "August", "September", "Oktober", "November", "Dezember",
+]
+
+@local_command("uhrzeit", "wie spät ist es", "wie viel uhr ist es", "wieviel uhr ist es", "uhrzeit")
+def _cmd_time(text: str) -> str:
+    now = datetime.now()
+    if now.minute == 0:
+        return f"Es ist {now.hour} Uhr, Meister Tobias."
+    return f"Es ist {now.hour} Uhr {now.minute}, Meister Tobias."
+
+@local_command("datum", "welcher tag ist heute", "welches datum haben wir", "was ist heute für ein tag")
+def _cmd_date(text: str) -> str:
+    now = datetime.now()
+    return f"Heute ist {WOCHENTAGE[now.weekday()]}, der {now.day}. {MONATE[now.month - 1]}."
+
+@local_command("lauter", "lauter", "sprich lauter")
+def _cmd_louder(text: str) -> str:
+    global tts_volume_offset
+    if tts_volume_offset >= 100:
+        return "Das ist schon das Maximum."
+    tts_volume_offset = min(100, tts_volume_offset + TTS_VOLUME_STEP)
+    return "Ist gut, ich drehe etwas auf."
+
+@local_command("leiser", "leiser", "sprich leiser")
+def _cmd_quieter(text: str) -> str:
+    global tts_volume_offset
+    if tts_volume_offset <= -80:
+        return "Weiter runter wird es unhörbar."
+    tts_volume_offset = max(-80, tts_volume_offset - TTS_VOLUME_STEP)
+    return "Ist gut, ich drehe etwas runter."
+
+@local_command("stopp", "stopp", "stop", "halt", "sei still", "ruhe", barge_in=True)
+def _cmd_stop(text: str) -> None:
+    interrupt_tts()
+    return None
+
+
+# =============================
+# Vosk Setup (Basis in vosk_setup.py)
+# =============================
+def _calibration_audio() -> bytes | None:
+    """
+    returns: PCM aus ASR_CALIBRATION_WAV, oder None wenn nicht nutzbar
+    (dann kalibriert AdaptiveRecognizer mit dem ersten echten Diktat).
+    Synthetisches Signal taugt nicht: Rauschen wird durch das Beam-Pruning ganz
+    anders teuer decodiert als Sprache, die RTF-Verhältnisse wären wertlos.
+    """
+    path = ASR_CALIBRATION_WAV
+    if not path or not os.path.isfile(path):
+        print(
+            f"[ASR] Keine Kalibrier-Aufnahme '{path}' – kalibriere mit den ersten "
+            f"{ASR_CALIBRATION_SEC:.0f} s Diktat, bis dahin bleibt es bei {MODEL_PATH}."
+        )
+        return None
+    try:
+        with wave.open(path, "rb") as wf:
+            fmt = (wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+            if fmt != (SAMPLE_RATE, 1, 2):
+                print(
+                    f"[ASR] WARNUNG: {path} hat {fmt[0]} Hz / {fmt[1]} Kanäle / {fmt[2] * 8} bit, "
+                    f"erwartet {SAMPLE_RATE} Hz / 1 / 16 – kalibriere mit erstem Diktat.",
+                    file=sys.stderr,
+                )
+                return None
+            pcm = wf.readframes(int(ASR_CALIBRATION_SEC * SAMPLE_RATE))
+    except (OSError, wave.Error) as e:
+        print(f"[ASR] WARNUNG: {path} nicht lesbar ({e}) – kalibriere mit erstem Diktat.", file=sys.stderr)
+        return None
+    if not pcm:
+        print(f"[ASR] WARNUNG: {path} ist leer – kalibriere mit erstem Diktat.", file=sys.stderr)
+        return None
+    return pcm
+
+def _save_calibration_audio(pcm: bytes):
+    # eine vorhandene (evtl. unbrauchbare) Datei des Benutzers nicht überschreiben
+    path = ASR_CALIBRATION_WAV
+    if not path or os.path.exists(path):
+        return
+    try:
+        with wave.open(path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(pcm)
+        print(f"[ASR] Kalibrier-Aufnahme gespeichert: {path}")
+    except (OSError, wave.Error) as e:
+        print(f"[ASR] Kalibrier-Aufnahme nicht speicherbar ({e}).", file=sys.stderr)
+
+def calibrate_model(model: Model, pcm: bytes) -> float:
+    rec = make_dict_recognizer(model)
+    step = BLOCKSIZE * 2
+    t0 = time.perf_counter()
+    for i in range(0, len(pcm), step):
+        rec.AcceptWaveform(pcm[i:i + step])
+    rec.FinalResult()
+    return (time.perf_counter() - t0) / (len(pcm) / (2 * SAMPLE_RATE))
+
+class AdaptiveRecognizer:
+    """
+    Diktat-Recognizer über einer Rangliste von Vosk-Modellen (groß -> klein).
+    Misst laufend den Real-Time-Factor und wechselt zwischen zwei Äußerungen auf
+    das größte Modell, das im Budget bleibt. Verhält sich wie ein KaldiRecognizer.
+    Mit calib_pcm werden veraltete Kalibrierwerte im Hintergrund erneuert, damit
+    eine einmal ungünstige Messung ein Upgrade nicht dauerhaft verhindert.
+    Ohne calib_pcm startet er auf MODEL_PATH, sammelt die ersten
+    ASR_CALIBRATION_SEC erkannter Sprache und kalibriert damit im Hintergrund;
+    bis dahin gibt es kein Upgrade.
+    """
+    def __init__(self, models: list[tuple[str, Model, float]], budget: float = ASR_RTF_BUDGET,
+                 calib_pcm: bytes | None = None):
+        self.models = models            # (Pfad, Modell, kalibrierter RTF)
+        self.budget = budget
+        self.calib_pcm = calib_pcm
+        self.calibrated = calib_pcm is not None
+        self.calibrated_at = [time.monotonic()] * len(models)
+        self._recal_running = False
+        self._collecting = calib_pcm is None and len(models) > 1
+        self._utt = bytearray()         # Audio der laufenden Äußerung (nur bis kalibriert)
+        self._speech = bytearray()      # gesammelte Sprache für die Kalibrierung
+        if self.calibrated:
+            self.idx = next((i for i, m in enumerate(models) if m[2] <= budget), len(models) - 1)
+        else:
+            self.idx = next((i for i, m in enumerate(models) if m[0] == MODEL_PATH), len(models) - 1)
+        self.rec = make_dict_recognizer(models[self.idx][1])
+        self.rtf = models[self.idx][2]  # EWMA des gemessenen RTF
+        self.last_switch = time.monotonic()
+        self.last_upgrade = 0.0
+        self.hold = ASR_UPGRADE_HOLD_SEC
+
+        self._hist = asr_rtf_histogram("dict")
+        self._g_idx = metrics.gauge("asr_model_index", "Index des aktiven Diktat-Modells (0 = größtes)")
+        self._g_rtf = metrics.gauge("asr_dict_rtf_ewma", "Geglätteter RTF des Diktat-Modells")
+        self._c_switch = metrics.counter("asr_model_switches_total", "Wechsel des Diktat-Modells")
+        self._g_idx.set(self.idx)
+
+    @property
+    def path(self) -> str:
+        return self.models[self.idx][0]
+
+    def AcceptWaveform(self, data: bytes) -> bool:
+        if self._collecting and len(self._utt) < self._calib_bytes():
+            self._utt.extend(data)
+        t0 = time.perf_counter()
+        done = self.rec.AcceptWaveform(data)
+        audio_sec = len(data) / (2 * CHANNELS * SAMPLE_RATE)
+        if audio_sec > 0:
+            rtf = (time.perf_counter() - t0) / audio_sec
+            self.rtf += ASR_RTF_EWMA_ALPHA * (rtf - self.rtf)
+            self._hist.observe(rtf)
+            self._g_rtf.set(self.rtf)
+        return done
+
+    def Result(self) -> str:
+        res = self.rec.Result()
+        self._collect_calibration(res)
+        return res
+
+    def FinalResult(self) -> str:
+        res = self.rec.FinalResult()
+        self._collect_calibration(res)
+        return res
+
+    def Reset(self):
+        self._utt.clear()
+        self.rec.Reset()
+
+    @staticmethod
+    def _calib_bytes() -> int:
+        return int(ASR_CALIBRATION_SEC * SAMPLE_RATE) * 2
+
+    def _collect_calibration(self, result_json: str):
+        """
+        Übernimmt das Audio einer Äußerung mit erkanntem Text, bis genug Sprache
+        für die Kalibrierung beisammen ist (Stille/Rauschen zählt nicht).
+        """
+        if not self._collecting:
+            return
+        utt, self._utt = self._utt, bytearray()
+        if not (json.loads(result_json).get("text") or "").strip():
+            return
+        self._speech.extend(utt)
+        need = self._calib_bytes()
+        if len(self._speech) < need:
+            return
+        self.calib_pcm = bytes(self._speech[:need])
+        self._speech = bytearray()
+        self._collecting = False
+        _save_calibration_audio(self.calib_pcm)
+        self._start_recalibration(range(len(self.models)))
+
+    def _target(self, backlog: int) -> int:
+        last = len(self.models) - 1
+        if self.idx < last and (self.rtf > self.budget or backlog > ASR_BACKLOG_MAX):
+            return self.idx + 1
+        if (
+            self.idx > 0
+            and self.calibrated
+            and backlog <= 1
+            and time.monotonic() - self.last_switch >= self.hold
+        ):
+            # aktuelle Last auf das größere Modell hochrechnen
+            predicted = self.rtf * self.models[self.idx - 1][2] / self.models[self.idx][2]
+            if predicted <= self.budget * ASR_RTF_HEADROOM:
+                return self.idx - 1
+            if time.monotonic() - self.calibrated_at[self.idx - 1] >= ASR_RECALIBRATE_SEC:
+                self._start_recalibration((self.idx - 1, self.idx))
+        return self.idx
+
+    def _start_recalibration(self, indices):
+        if self.calib_pcm is None or self._recal_running:
+            return
+        self._recal_running = True
+        threading.Thread(target=self._recalibrate, args=(list(indices),), daemon=True).start()
+
+    def _recalibrate(self, indices: list[int]):
+        """
+        Misst die Modelle direkt nacheinander, damit ihre Verhältnisse unter
+        derselben Last entstehen.
+        """
+        try:
+            for j in indices:
+                path, model, _ = self.models[j]
+                rtf = calibrate_model(model, self.calib_pcm)
+                self.models[j] = (path, model, rtf)
+                self.calibrated_at[j] = time.monotonic()
+            if not self.calibrated:
+                # bisher gemessener RTF gehört zum aktuellen Modell, bleibt gültig
+                self.calibrated = True
+            print("[ASR] Kalibriert: " + ", ".join(
+                f"{self.models[j][0]} RTF {self.models[j][2]:.2f}" for j in indices), file=sys.stderr)
+        except Exception as e:
+            print(f"[ASR] Neukalibrierung fehlgeschlagen: {e}", file=sys.stderr)
+        finally:
+            self._recal_running = False
+
+    def maybe_switch(self, backlog: int) -> str | None:
+        """
+        Vor jedem Block aufrufen. backlog: aktuelle Länge von audio_q.
+        returns: Result-JSON der Äußerung, die ein erzwungener Wechsel beenden
+        musste (wie Result() weiterverarbeiten), sonst None
+        """
+        target = self._target(backlog)
+        if target == self.idx:
+            return None
+        # laufende Äußerung nicht abschneiden – außer audio_q läuft voll,
+        # dann das bisher Gesagte mit dem alten Modell abschließen
+        flushed = None
+        if json.loads(self.rec.PartialResult()).get("partial"):
+            if backlog <= ASR_BACKLOG_MAX:
+                return None
+            flushed = self.rec.FinalResult()
+
+        old = self.idx
+        self.idx = target
+        self.rec = make_dict_recognizer(self.models[target][1])
+        self.rtf *= self.models[target][2] / self.models[old][2]
+
+        now = time.monotonic()
+        if target < old:
+            self.last_upgrade = now
+        elif now - self.last_upgrade < 2 * self.hold:
+            # Upgrade hat nicht gehalten -> länger warten (gegen Flattern)
+            self.hold = min(ASR_UPGRADE_HOLD_MAX, self.hold * 2)
+        else:
+            self.hold = ASR_UPGRADE_HOLD_SEC
+        self.last_switch = now
+        self._g_idx.set(target)
+        self._c_switch.inc()
+        print(f"[ASR] Diktat-Modell: {self.models[old][0]} -> {self.path} (RTF ~{self.rtf:.2f})", file=sys.stderr)
+        return flushed
+
+def make_adaptive_recognizer(base_model: Model) -> AdaptiveRecognizer:
+    """
+    Lädt und kalibriert ASR_MODEL_CANDIDATES. Alle Modelle bleiben geladen: ein
+    Kandidat über dem Budget (z.B. weil der Rechner beim Start beschäftigt war)
+    wird später gewählt, sobald die gemessene Last es zulässt.
+    Ohne Kalibrier-Aufnahme kalibriert der Recognizer mit dem ersten Diktat.
+    """
+    pcm = _calibration_audio()
+
+    paths = [p for p in ASR_MODEL_CANDIDATES if p == MODEL_PATH or os.path.isdir(p)]
+    if MODEL_PATH not in paths:
+        paths.append(MODEL_PATH)
+
+    models = []
+    for path in paths:
+        model = base_model if path == MODEL_PATH else Model(path)
+        if pcm is None:
+            models.append((path, model, ASR_RTF_BUDGET))     # Platzhalter bis zur Kalibrierung
+            continue
+        rtf = calibrate_model(model, pcm)
+        print(f"[ASR] {path}: Kalibrierung RTF {rtf:.2f}")
+        models.append((path, model, rtf))
+
+    rec = AdaptiveRecognizer(models, calib_pcm=pcm)
+    print(f"[ASR] Diktat-Modell: {rec.path}")
+    return rec
+
+
 # =============================
 # Main
 # =============================
 def main():
-    if not os.path.isdir(MODEL_PATH):
-        raise SystemExit(f"Vosk-Modellpfad nicht gefunden: {MODEL_PATH}")
-
     print("Lade Vosk-Modell…")
-    model = Model(MODEL_PATH)
+    model = load_vosk_model(MODEL_PATH)
 
     wake_grammar  = json.dumps([WAKE_PHRASE, EXIT_PHRASE])
     sleep_grammar = json.dumps([SLEEP_PHRASE, EXIT_PHRASE])
 
     wake_rec  = KaldiRecognizer(model, SAMPLE_RATE, wake_grammar)
     sleep_rec = KaldiRecognizer(model, SAMPLE_RATE, sleep_grammar)
-    dict_rec  = KaldiRecognizer(model, SAMPLE_RATE)
+    dict_rec  = make_adaptive_recognizer(model)
+
+    command_trie = build_command_trie(LOCAL_COMMANDS if LOCAL_COMMANDS_ENABLED else [])
+    # während TTS spricht, nur Kommandos ohne eigene Antwort (z.B. "stopp")
+    barge_in_cmds = [c for c in LOCAL_COMMANDS if c.barge_in] if LOCAL_COMMANDS_ENABLED else []
+    barge_in_trie = build_command_trie(barge_in_cmds)
+    cmd_rec = None
+    if barge_in_cmds:
+        cmd_rec = KaldiRecognizer(model, SAMPLE_RATE, command_grammar(barge_in_cmds))
+    cmd_listening = False
+
+    rtf_wake  = asr_rtf_histogram("wake")
+    rtf_sleep = asr_rtf_histogram("sleep")
+    rtf_cmd   = asr_rtf_histogram("command")
 
     device_index = pick_input_device_by_hint(DEVICE_HINT)
     if device_index is not None:
@@ -634,6 +1500,13 @@ def main():
         elif TTS_MODE.lower() == "pyttsx3":
             print("[TTS] Modus: pyttsx3 (offline) " + ("OK" if HAVE_PYTTSX3 else "NICHT verfügbar"))
 
+    if METRICS_ENABLED:
+        try:
+            start_metrics_server(metrics, METRICS_HOST, METRICS_PORT)
+            print(f"[Metriken] http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"[Metriken] Server konnte nicht starten: {e}", file=sys.stderr)
+
     stop_evt = threading.Event()
 
     th_gem = threading.Thread(target=gemini_worker, args=(stop_evt,), daemon=True)
@@ -666,7 +1539,7 @@ def main():
 
                 # ---------- Commands ----------
                 if not active:
-                    if wake_rec.AcceptWaveform(data):
+                    if accept_timed(wake_rec, data, rtf_wake):
                         txt = (json.loads(wake_rec.Result()).get("text") or "").strip()
                         if txt and (now - last_transition >= COOLDOWN_SEC):
                             if starts_with_phrase(txt, EXIT_PHRASE):
@@ -679,26 +1552,21 @@ def main():
                                 break
 
                             if starts_with_phrase(txt, WAKE_PHRASE):
-                                with state_lock:
-                                    session_state.active = True
-                                    session_state.session_id += 1
+                                set_session_active(True)
                                 last_transition = now
                                 dictation_block_until = now + ARMING_DELAY_SEC
                                 print("\n[Michaela] Aktiviert.")
-                                try:
-                                    text_q.put_nowait("__WAKE__")
-                                except queue.Full:
-                                    flush_queue(text_q)
-                                    text_q.put_nowait("__WAKE__")
 
                                 dict_rec.Reset()
                                 wake_rec.Reset()
                                 sleep_rec.Reset()
+                                if cmd_rec is not None:
+                                    cmd_rec.Reset()
                                 flush_queue(audio_q)
                     continue
 
                 # active == True
-                if sleep_rec.AcceptWaveform(data):
+                if accept_timed(sleep_rec, data, rtf_sleep):
                     txt = (json.loads(sleep_rec.Result()).get("text") or "").strip()
                     if txt and (now - last_transition >= COOLDOWN_SEC):
                         if starts_with_phrase(txt, EXIT_PHRASE):
@@ -711,21 +1579,16 @@ def main():
                             break
 
                         if starts_with_phrase(txt, SLEEP_PHRASE):
-                            with state_lock:
-                                session_state.active = False
-                                session_state.session_id += 1
+                            set_session_active(False)
                             last_transition = now
                             dictation_block_until = now + ARMING_DELAY_SEC
                             print("\n[Michaela] Deaktiviert. Warte wieder auf Wake-Phrase…")
-                            try:
-                                text_q.put_nowait("__SLEEP__")
-                            except queue.Full:
-                                flush_queue(text_q)
-                                text_q.put_nowait("__SLEEP__")
 
                             dict_rec.Reset()
                             wake_rec.Reset()
                             sleep_rec.Reset()
+                            if cmd_rec is not None:
+                                cmd_rec.Reset()
                             flush_queue(audio_q)
                             continue
 
@@ -733,12 +1596,32 @@ def main():
                 if time.monotonic() < dictation_block_until:
                     continue
 
-                # Während TTS spricht: Dictat unterdrücken (verhindert Feedback-Loop)
+                # Während TTS spricht: Dictat unterdrücken (verhindert Feedback-Loop),
+                # nur die Stopp-Grammatik hört mit (barge_in-Kommandos)
                 if tts_busy_evt.is_set():
+                    if cmd_rec is not None:
+                        cmd_listening = True
+                        if accept_timed(cmd_rec, data, rtf_cmd):
+                            txt = (json.loads(cmd_rec.Result()).get("text") or "").strip()
+                            cmd = match_local_command(barge_in_trie, txt) if txt else None
+                            if cmd is not None:
+                                print("Du:", txt)
+                                run_local_command(cmd, txt)
                     continue
 
+                if cmd_listening:
+                    cmd_rec.Reset()
+                    cmd_listening = False
+
+                results = []
+                flushed = dict_rec.maybe_switch(audio_q.qsize())
+                if flushed is not None:
+                    results.append(flushed)
                 if dict_rec.AcceptWaveform(data):
-                    text = (json.loads(dict_rec.Result()).get("text") or "").strip()
+                    results.append(dict_rec.Result())
+
+                for res in results:
+                    text = (json.loads(res).get("text") or "").strip()
                     if not text:
                         continue
 
@@ -752,14 +1635,20 @@ def main():
 
                     print("Du:", text)
 
+                    # Fast Path: bekannte Kommandos lokal beantworten
+                    cmd = match_local_command(command_trie, nt)
+                    if cmd is not None:
+                        run_local_command(cmd, text)
+                        continue
+
                     try:
                         text_q.put_nowait(text)
                     except queue.Full:
-                        flush_queue(text_q, max_items=TEXT_QUEUE_MAX)
+                        M_QUEUE_DROPS["text"].inc(flush_queue(text_q, max_items=TEXT_QUEUE_MAX))
                         try:
                             text_q.put_nowait(text)
                         except queue.Full:
-                            pass
+                            M_QUEUE_DROPS["text"].inc()
 
         except KeyboardInterrupt:
             print("\nBeendet durch Benutzer.")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Soak-Test: treibt synthetische Wake/Ask/Sleep-Zyklen durch gemini_worker und
+tts_worker aus chat.py – mit lokalen Stand-ins statt Gemini und edge-tts.
+
+    python soak.py --duration 3600 --interval 30
+
+In festen Abständen werden RSS, tracemalloc-Heap, Thread-Lebendigkeit und
+Queue-Längen gesampelt. Der Lauf schlägt fehl (Exit-Code 1), wenn Wachstum oder
+Stillstand die konfigurierten Schwellen überschreiten.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from dataclasses import dataclass, asdict
+
+import chat
+
+
+# =============================
+# Stand-ins
+# =============================
+class FakeResponse:
+    candidates = None
+
+    def __init__(self, text: str):
+        self.text = text
+
+class FakeChat:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.history: list[tuple[str, str]] = []
+
+    def send_message(self, text: str):
+        time.sleep(self.delay * random.uniform(0.5, 1.5))
+        answer = f"Antwort {len(self.history) + 1} auf: {text}. " * 3
+        self.history.append((text, answer))
+        return FakeResponse(answer)
+
+class FakeClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.live_chats: "weakref.WeakSet[FakeChat]" = weakref.WeakSet()
+        self.chats = self      # client.chats.create(...)
+
+    def create(self, **kwargs) -> FakeChat:
+        c = FakeChat(self.delay)
+        self.live_chats.add(c)
+        return c
+
+    def close(self):
+        pass
+
+class FakeSpeaker:
+    """
+    Simuliert edge-tts: PCM-Puffer proportional zur Textlänge + Wiedergabedauer.
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.spoken = 0
+        self.last_spoken = time.monotonic()
+
+    def __call__(self, text: str):
+        pcm = bytearray(24000 * 2 * max(1, len(text) // 40))
+        time.sleep(self.delay)
+        del pcm
+        self.spoken += 1
+        self.last_spoken = time.monotonic()
+
+
+# =============================
+# Treiber
+# =============================
+QUESTIONS = [
+    "Wie wird das Wetter morgen",
+    "Erkläre mir kurz Rekursion",
+    "Was ist ein guter Name für einen Roboter",
+    "Fasse die Relativitätstheorie in einem Satz zusammen",
+]
+
+@dataclass
+class DriverStats:
+    cycles: int = 0
+    asked: int = 0
+    stalls: int = 0
+    blocked: int = 0      # text_q voll: Frage konnte nicht eingereiht werden
+
+def put_until(q: queue.Queue, item: str, timeout: float, stop_evt: threading.Event) -> bool:
+    """
+    Wie q.put(), blockiert aber höchstens timeout Sekunden und endet früher bei stop_evt.
+    returns: False, wenn die Queue die ganze Zeit voll war
+    """
+    deadline = time.monotonic() + timeout
+    while not stop_evt.is_set():
+        try:
+            q.put(item, timeout=min(0.1, max(0.0, deadline - time.monotonic())))
+            return True
+        except queue.Full:
+            if time.monotonic() >= deadline:
+                return False
+    return False
+
+def drive(stop_evt: threading.Event, speaker: FakeSpeaker, stats: DriverStats,
+          questions_per_cycle: int, answer_timeout: float):
+    while not stop_evt.is_set():
+        chat.set_session_active(True)
+        for _ in range(questions_per_cycle):
+            if stop_evt.is_set():
+                break
+            before = speaker.spoken
+            if not put_until(chat.text_q, random.choice(QUESTIONS), answer_timeout, stop_evt):
+                if not stop_evt.is_set():
+                    stats.blocked += 1
+                continue
+            stats.asked += 1
+            deadline = time.monotonic() + answer_timeout
+            while speaker.spoken == before and time.monotonic() < deadline and not stop_evt.is_set():
+                time.sleep(0.01)
+            if speaker.spoken == before and not stop_evt.is_set():
+                stats.stalls += 1
+        chat.set_session_active(False)
+        stats.cycles += 1
+        time.sleep(0.05)
+
+
+# =============================
+# Sampling
+# =============================
+@dataclass
+class Sample:
+    t: float
+    rss_mb: float
+    heap_mb: float
+    threads: int
+    gem_alive: bool
+    tts_alive: bool
+    q_audio: int
+    q_text: int
+    q_tts: int
+    chats: int
+    history: int
+    cycles: int
+    answers: int
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def take_sample(t0: float, client: FakeClient, speaker: FakeSpeaker, stats: DriverStats,
+                th_gem: threading.Thread, th_tts: threading.Thread) -> Sample:
+    live = list(client.live_chats)
+    return Sample(
+        t=round(time.monotonic() - t0, 1),
+        rss_mb=round(rss_mb(), 2),
+        heap_mb=round(tracemalloc.get_traced_memory()[0] / (1024 * 1024), 2),
+        threads=threading.active_count(),
+        gem_alive=th_gem.is_alive(),
+        tts_alive=th_tts.is_alive(),
+        q_audio=chat.audio_q.qsize(),
+        q_text=chat.text_q.qsize(),
+        q_tts=chat.tts_q.qsize(),
+        chats=len(live),
+        history=sum(len(c.history) for c in live),
+        cycles=stats.cycles,
+        answers=speaker.spoken,
+    )
+
+def print_header(out):
+    print(f"{'t[s]':>8} {'rss':>8} {'heap':>7} {'thr':>4} {'gem':>3} {'tts':>3} "
+          f"{'q a/t/s':>9} {'chats':>5} {'hist':>5} {'cyc':>6} {'ans':>7}", file=out)
+
+def print_sample(s: Sample, out):
+    print(f"{s.t:>8.1f} {s.rss_mb:>8.1f} {s.heap_mb:>7.2f} {s.threads:>4} "
+          f"{'ok' if s.gem_alive else '--':>3} {'ok' if s.tts_alive else '--':>3} "
+          f"{f'{s.q_audio}/{s.q_text}/{s.q_tts}':>9} {s.chats:>5} {s.history:>5} "
+          f"{s.cycles:>6} {s.answers:>7}", file=out, flush=True)
+
+
+# =============================
+# Main
+# =============================
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Soak-Test der Michaela-Pipeline mit lokalen Stand-ins")
+    ap.add_argument("--duration", type=float, default=600.0, help="Laufzeit in Sekunden")
+    ap.add_argument("--interval", type=float, default=10.0, help="Sampling-Intervall in Sekunden")
+    ap.add_argument("--warmup", type=float, default=20.0, help="Baseline erst nach dieser Zeit")
+    ap.add_argument("--questions", type=int, default=3, help="Fragen pro Wake/Sleep-Zyklus")
+    ap.add_argument("--llm-delay", type=float, default=0.05, help="simulierte Gemini-Latenz (s)")
+    ap.add_argument("--tts-delay", type=float, default=0.02, help="simulierte Wiedergabedauer (s)")
+    ap.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    ap.add_argument("--max-heap-growth-mb", type=float, default=10.0)
+    ap.add_argument("--max-queue-depth", type=int, default=chat.TEXT_QUEUE_MAX // 2)
+    ap.add_argument("--stall-sec", type=float, default=15.0, help="keine Antwort für so lange = Stillstand")
+    ap.add_argument("--join-timeout", type=float, default=2.0, help="Frist für Thread-Ende beim Stoppen")
+    ap.add_argument("--json", metavar="PFAD", help="Samples zusätzlich als JSONL schreiben")
+    ap.add_argument("--verbose", action="store_true", help="Ausgaben der Pipeline nicht unterdrücken")
+    args = ap.parse_args(argv)
+
+    out = sys.stdout
+    json_out = open(args.json, "w", encoding="utf-8") if args.json else None
+    failures: list[str] = []
+
+    tracemalloc.start(10)
+    client = FakeClient(args.llm_delay)
+    speaker = FakeSpeaker(args.tts_delay)
+    stats = DriverStats()
+
+    stop_evt = threading.Event()
+    drive_stop = threading.Event()
+    th_gem = threading.Thread(target=chat.gemini_worker, args=(stop_evt, lambda: client), daemon=True)
+    th_tts = threading.Thread(target=chat.tts_worker, args=(stop_evt, speaker), daemon=True)
+    th_drv = threading.Thread(
+        target=drive, args=(drive_stop, speaker, stats, args.questions, args.stall_sec), daemon=True
+    )
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    samples: list[Sample] = []
+    baseline: Sample | None = None
+    baseline_snap = None
+    stall_reported = False
+
+    print_header(out)
+    with quiet:
+        t0 = time.monotonic()
+        th_gem.start()
+        th_tts.start()
+        th_drv.start()
+
+        next_sample = t0
+        while time.monotonic() - t0 < args.duration:
+            time.sleep(max(0.0, next_sample - time.monotonic()))
+            next_sample += args.interval
+
+            s = take_sample(t0, client, speaker, stats, th_gem, th_tts)
+            samples.append(s)
+            print_sample(s, out)
+            if json_out:
+                json_out.write(json.dumps(asdict(s)) + "\n")
+                json_out.flush()
+
+            if baseline is None and s.t >= args.warmup:
+                baseline = s
+                baseline_snap = tracemalloc.take_snapshot()
+
+            if not (s.gem_alive and s.tts_alive):
+                failures.append(f"t={s.t}s: Worker-Thread beendet (gemini={s.gem_alive}, tts={s.tts_alive})")
+                break
+            if not stall_reported and time.monotonic() - speaker.last_spoken > args.stall_sec:
+                failures.append(f"t={s.t}s: seit {args.stall_sec:.0f}s keine Antwort (Stillstand)")
+                stall_reported = True
+            if max(s.q_text, s.q_tts) > args.max_queue_depth:
+                failures.append(f"t={s.t}s: Queue-Tiefe {s.q_text}/{s.q_tts} > {args.max_queue_depth}")
+
+        # Stoppen wie main(): erst stop_evt, dann __EXIT__ – nie blockierend, damit
+        # ein hängender Worker als Fehler gemeldet wird statt den Soak festzuhalten
+        stop_evt.set()
+        drive_stop.set()
+        th_drv.join(timeout=args.join_timeout)
+        for q, name in ((chat.text_q, "text_q"), (chat.tts_q, "tts_q")):
+            try:
+                q.put_nowait("__EXIT__")
+            except queue.Full:
+                failures.append(f"{name} voll beim Beenden – __EXIT__ nicht zustellbar")
+        for th, name in ((th_gem, "gemini_worker"), (th_tts, "tts_worker"), (th_drv, "driver")):
+            th.join(timeout=args.join_timeout)
+            if th.is_alive():
+                failures.append(f"{name} hängt beim Beenden (> {args.join_timeout}s)")
+
+    last = samples[-1] if samples else None
+    if baseline is not None and last is not None and last is not baseline:
+        rss_growth = last.rss_mb - baseline.rss_mb
+        heap_growth = last.heap_mb - baseline.heap_mb
+        print(f"\nWachstum seit t={baseline.t}s: RSS {rss_growth:+.2f} MB, Heap {heap_growth:+.2f} MB, "
+              f"Chats {baseline.chats}->{last.chats}, History {baseline.history}->{last.history}", file=out)
+        if rss_growth > args.max_rss_growth_mb:
+            failures.append(f"RSS-Wachstum {rss_growth:.2f} MB > {args.max_rss_growth_mb} MB")
+        if heap_growth > args.max_heap_growth_mb:
+            failures.append(f"Heap-Wachstum {heap_growth:.2f} MB > {args.max_heap_growth_mb} MB")
+
+        top = tracemalloc.take_snapshot().compare_to(baseline_snap, "lineno")[:5]
+        print("Top-Wachstum (tracemalloc):", file=out)
+        for stat in top:
+            print(f"  {stat}", file=out)
+    else:
+        print("\nZu kurz für eine Baseline (--warmup/--duration prüfen).", file=out)
+
+    if stats.stalls:
+        failures.append(f"{stats.stalls} Fragen ohne Antwort innerhalb {args.stall_sec:.0f}s")
+    if stats.blocked:
+        failures.append(f"{stats.blocked} Fragen nicht einreihbar (text_q {args.stall_sec:g}s voll)")
+
+    print(f"Zyklen: {stats.cycles}, Fragen: {stats.asked}, Antworten: {speaker.spoken}", file=out)
+    if failures:
+        print("FAIL", file=out)
+        for f in failures:
+            print("  - " + f, file=out)
+    else:
+        print("OK", file=out)
+
+    if json_out:
+        json_out.close()
+    tracemalloc.stop()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
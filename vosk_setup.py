@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemeinsames Vosk-Setup für chat.py und batch_transcribe.py.
+Hängt bewusst nur von Vosk ab (kein sounddevice/Gemini), damit die
+Batch-Transkription auch auf Rechnern ohne Audio-Gerät läuft.
+"""
+
+import os
+
+from vosk import Model, KaldiRecognizer
+
+
+# =============================
+# Konfiguration
+# =============================
+MODEL_PATH   = "vosk-model-small-de-0.15"
+SAMPLE_RATE  = 16000
+BLOCKSIZE    = 4000
+
+
+# =============================
+# Setup
+# =============================
+def load_vosk_model(path: str = MODEL_PATH) -> Model:
+    if not os.path.isdir(path):
+        raise SystemExit(f"Vosk-Modellpfad nicht gefunden: {path}")
+    return Model(path)
+
+def make_dict_recognizer(model: Model, rate: int = SAMPLE_RATE) -> KaldiRecognizer:
+    return KaldiRecognizer(model, rate)